@@ -8,31 +8,82 @@ the workflow while keeping side effects isolated for testability.
 
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Callable, Iterable, List, Mapping, Optional, Set
+from typing import Callable, Iterable, Iterator, List, Mapping, Optional, Set
 
+import functools
+import hmac
+import io
 import logging
 import os
+import re
 import smtplib
 import ssl
+import struct
 import tempfile
 import zipfile
+import zlib
+
+from html import unescape
 
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-from bs4 import BeautifulSoup
-import qrcode
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+	HttpResponseError,
+	ResourceNotFoundError,
+	ResourceNotModifiedError,
+)
+from azure.storage.blob import BlobServiceClient, BlobType
+from lxml import etree
+import lxml.html
+import segno
 from PIL import Image, ImageDraw, ImageFont
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from email.message import EmailMessage
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Matches the rigid "PO: ... | Item: ... | Desc: ..." rows emitted by the WMS.
+_ROW_RE = re.compile(r"PO:\s*([^|]+?)\s*\|\s*Item:\s*([^|]+?)\s*\|\s*Desc:\s*(.+)\s*$")
+
+# Variant rows only ever live in <td> cells; a compiled XPath keeps the
+# fallback traversal entirely inside libxml2.
+_TD_XPATH = etree.XPath("//td")
+
+# First email-looking token in a forwarded header; intentionally loose, since
+# the value is compared against the configured WMS sender afterwards anyway.
+_EMAIL_RE = re.compile(r"[A-Za-z0-9_.+-]+@[A-Za-z0-9.-]+")
+
+# Fast path for the machine-generated WMS template: grabs the text of plain
+# "PO: ..." cells straight from the raw markup without building a tree. Cells
+# containing nested tags will not match; the caller compares the match count
+# against the raw "PO:" occurrence count and reparses with lxml on a shortfall.
+_CELL_TEXT_RE = re.compile(r"<td[^>]*>\s*(PO:\s*[^<]+?)\s*</td>", re.IGNORECASE)
+
+# Loading the system CA bundle is expensive; do it once per worker rather
+# than on every outbound email.
+_SSL_CONTEXT = ssl.create_default_context()
+
+# Canvas dimensions at 300 DPI for 70mm x 30mm labels, plus the legacy layout
+# metrics, fixed here so the per-variant path does no repeated arithmetic.
+_DPI = 300
+_CANVAS_WIDTH = int(70 * 0.0393701 * _DPI)
+_CANVAS_HEIGHT = int(30 * 0.0393701 * _DPI)
+_QR_TARGET_WIDTH = 150
+_QR_BORDER = 4
+_QR_PADDING_X = 40
+_QR_PADDING_Y = 40
+_DESCRIPTION_MAX_WIDTH = _CANVAS_WIDTH // 2 + 200
+# Copying a prebuilt white canvas is a single memcpy, versus an allocation
+# plus fill for every Image.new call in the per-variant loop. The artwork is
+# black-on-white, so a single-channel canvas carries a third of the bytes of
+# the RGB one through every draw, paste, and PNG-encode pass.
+_LABEL_TEMPLATE = Image.new("L", (_CANVAS_WIDTH, _CANVAS_HEIGHT), 255)
+
 
 @dataclass(frozen=True)
 class Variant:
@@ -60,35 +111,53 @@ def parse_html_email(html_content: str) -> List[Variant]:
 	if not html_content:
 		return []
 
-	soup = BeautifulSoup(html_content, "html.parser")
+	# Cheap substring scan before building any tree: non-PO emails (the
+	# common case for a shared mailbox) skip the HTML parse entirely.
+	if "PO:" not in html_content or "Item:" not in html_content:
+		return []
+
+	return list(_parse_variants_cached(html_content))
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_variants_cached(html_content: str) -> tuple[Variant, ...]:
+	"""Extract variants from a PO email body, memoised on the exact string.
+
+	Logic App retries redeliver byte-identical bodies, so repeats skip the
+	regex scan and any parser fallback. Malformed bodies raise and are never
+	cached, keeping retry semantics for the error path.
+	"""
+
+	cell_texts = [unescape(match.group(1)) for match in _CELL_TEXT_RE.finditer(html_content)]
+	if len(cell_texts) < html_content.count("PO:"):
+		# The raw scan captured fewer cells than there are "PO:" occurrences,
+		# so some rows carry nested markup (or the template drifted). Reparse
+		# the whole body with lxml — a precompiled XPath keeps the tree build
+		# and cell traversal in libxml2 — rather than merging partial results,
+		# so no row is silently dropped.
+		tree = lxml.html.fromstring(html_content)
+		cell_texts = [cell.text_content().strip() for cell in _TD_XPATH(tree)]
+
 	variants: List[Variant] = []
 	malformed_detected = False
 
-	for cell in soup.find_all("td"):
-		text = cell.get_text(strip=True)
+	for text in cell_texts:
 		# Only process cells that contain both 'PO:' and 'Item:' (case-sensitive)
 		if "PO:" in text and "Item:" in text:
-			segments = [segment.strip() for segment in text.split("|")]
-			if len(segments) != 3:
-				malformed_detected = True
-				continue
-
-			try:
-				po_number = segments[0].split(":", 1)[1].strip()
-				item_code = segments[1].split(":", 1)[1].strip()
-				description = segments[2].split(":", 1)[1].strip()
-			except IndexError:
+			match = _ROW_RE.match(text)
+			if not match:
 				malformed_detected = True
 				continue
 
-			variants.append(Variant(po_number, item_code, description))
+			variants.append(Variant(*match.groups()))
 
 	if not variants and malformed_detected:
 		raise ValueError("Email body did not contain well-formed purchase order rows.")
 
-	return variants
+	return tuple(variants)
 
 
+@functools.lru_cache(maxsize=None)
 def _resolve_font_file(filename: str) -> Path:
 	"""Return the first existing path for ``filename`` across known locations."""
 
@@ -107,20 +176,102 @@ def _resolve_font_file(filename: str) -> Path:
 	)
 
 
+@functools.lru_cache(maxsize=8)
+def _load_font(filename: str, size: int) -> ImageFont.FreeTypeFont:
+	"""Load a bundled TrueType font once and reuse it across invocations."""
+
+	return ImageFont.truetype(str(_resolve_font_file(filename)), size)
+
+
+@functools.lru_cache(maxsize=128)
+def _bold_glyph(char: str) -> tuple[Image.Image, float]:
+	"""Return a rasterized bold glyph mask and its advance width.
+
+	Item codes draw from a small alphanumeric alphabet, so caching the
+	FreeType rasterization per character lets every variant reuse the same
+	glyph bitmaps instead of re-rendering the code on each label.
+	"""
+
+	font = _load_font("arialbd.ttf", 100)
+	advance = font.getlength(char)
+	ascent, descent = font.getmetrics()
+	mask = Image.new("L", (max(1, int(advance) + 1), ascent + descent), 0)
+	ImageDraw.Draw(mask).text((0, 0), char, font=font, fill=255)
+	return mask, advance
+
+
+def _draw_item_code(
+	label: Image.Image, item_code: str, position: tuple[int, int]
+) -> None:
+	"""Blit the item code onto the label from the cached glyph masks."""
+
+	x, y = position
+	offset = 0.0
+	for char in item_code:
+		mask, advance = _bold_glyph(char)
+		label.paste(0, (x + int(offset), y), mask)
+		offset += advance
+
+
+def _render_qr_image(qr: segno.QRCode, scale: int, border: int) -> Image.Image:
+	"""Rasterize a QR matrix directly into a grayscale PIL image.
+
+	Expands the boolean module grid with C-level bytes repetition instead of
+	round-tripping through a PNG encode and decode, and produces an exact
+	integer upscale with no resample pass.
+	"""
+
+	matrix = qr.matrix
+	size = (len(matrix) + 2 * border) * scale
+	quiet_zone = b"\xff" * (border * scale)
+	rows = [
+		(
+			quiet_zone
+			+ b"".join((b"\x00" if module else b"\xff") * scale for module in row)
+			+ quiet_zone
+		)
+		* scale
+		for row in matrix
+	]
+	quiet_band = (b"\xff" * size) * (border * scale)
+	return Image.frombytes("L", (size, size), quiet_band + b"".join(rows) + quiet_band)
+
+
+@functools.lru_cache(maxsize=2048)
+def _word_width(font: ImageFont.ImageFont, word: str) -> float:
+	"""Measure a word's pixel width once per font, caching across labels."""
+
+	return font.getlength(word)
+
+
 def _wrap_text(words: List[str], font: ImageFont.ImageFont, max_width: int) -> str:
-	"""Return wrapped text that fits within ``max_width`` pixels for the font."""
+	"""Return wrapped text that fits within ``max_width`` pixels for the font.
+
+	Each word is measured once and line widths are accumulated as running
+	sums (glyph advances are additive for these fonts), instead of
+	re-measuring every candidate line prefix through FreeType. Word widths
+	are cached across calls: descriptions for one purchase order reuse the
+	same part names and units over and over.
+	"""
 
+	space_width = _word_width(font, " ")
 	lines: List[str] = []
 	current_line: List[str] = []
+	current_width = 0.0
 
 	for word in words:
-		candidate = " ".join(current_line + [word])
-		if font.getlength(candidate) <= max_width:
+		word_width = _word_width(font, word)
+		candidate_width = current_width + word_width
+		if current_line:
+			candidate_width += space_width
+		if candidate_width <= max_width:
 			current_line.append(word)
+			current_width = candidate_width
 		else:
 			if current_line:
 				lines.append(" ".join(current_line))
 			current_line = [word]
+			current_width = word_width
 
 	if current_line:
 		lines.append(" ".join(current_line))
@@ -128,12 +279,41 @@ def _wrap_text(words: List[str], font: ImageFont.ImageFont, max_width: int) -> s
 	return "\n".join(lines)
 
 
-def generate_barcode_image(
-	item_code: str,
-	description: str,
-	output_dir: Optional[Path] = None,
-) -> Path:
-	"""Generate a legacy-formatted QR label image for a purchase-order line.
+def _png_chunk(chunk_type: bytes, payload: bytes) -> bytes:
+	"""Serialise one PNG chunk: length, type, payload, CRC-32."""
+
+	crc = zlib.crc32(payload, zlib.crc32(chunk_type))
+	return struct.pack(">I", len(payload)) + chunk_type + payload + struct.pack(">I", crc)
+
+
+def _encode_png_grayscale(label: Image.Image) -> bytes:
+	"""Encode an ``L``-mode image as a PNG with a single deflate pass.
+
+	Labels are mostly solid white with solid black glyphs, so filter type 0
+	on every scanline plus one ``zlib.compress(..., 1)`` call compresses
+	nearly as well as Pillow's filtered encoder while skipping its
+	per-chunk encode loop entirely.
+	"""
+
+	width, height = label.size
+	pixels = label.tobytes()
+	scanlines = b"".join(
+		b"\x00" + pixels[row * width : (row + 1) * width] for row in range(height)
+	)
+	header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+	return b"".join(
+		(
+			b"\x89PNG\r\n\x1a\n",
+			_png_chunk(b"IHDR", header),
+			_png_chunk(b"IDAT", zlib.compress(scanlines, 1)),
+			_png_chunk(b"IEND", b""),
+		)
+	)
+
+
+@functools.lru_cache(maxsize=256)
+def generate_barcode_png(item_code: str, description: str) -> tuple[str, bytes]:
+	"""Generate a legacy-formatted QR label for a purchase-order line.
 
 	The layout matches the historical on-premise tooling:
 
@@ -141,6 +321,53 @@ def generate_barcode_image(
 	* Variant code rendered in Arial Bold above wrapped description text
 	* QR code positioned on the right-hand side with 40px padding
 
+	Args:
+		item_code: SKU for which to create the barcode.
+		description: Human-readable description printed beneath the code.
+
+	Returns:
+		The label's file name and the encoded PNG bytes. Rendering in memory
+		keeps the per-variant hot path off the Function host's temp storage;
+		use :func:`generate_barcode_image` when a file on disk is needed.
+
+	Identical inputs always render identical labels, so results are memoised
+	for the worker's lifetime: variants recurring across purchase orders skip
+	the QR and canvas work entirely on warm instances.
+	"""
+
+	# Create QR code matching the historical configuration. segno keeps the
+	# Reed-Solomon and matrix-placement work in tight optimized loops, unlike
+	# the previous pure-Python qrcode package.
+	qr = segno.make(item_code, error="l", micro=False)
+	# Pick the scale so the rendered QR lands on (or just under) the legacy
+	# 150px target, avoiding a second resample of the generated image.
+	scale = max(1, _QR_TARGET_WIDTH // qr.symbol_size(scale=1, border=_QR_BORDER)[0])
+	qr_image = _render_qr_image(qr, scale, _QR_BORDER)
+
+	label = _LABEL_TEMPLATE.copy()
+	label.paste(qr_image, (_CANVAS_WIDTH - qr_image.width - _QR_PADDING_X, _QR_PADDING_Y))
+
+	draw = ImageDraw.Draw(label)
+	main_font = _load_font("arial.ttf", 45)
+
+	_draw_item_code(label, item_code, (30, 30))
+	wrapped_description = _wrap_text(description.split(), main_font, _DESCRIPTION_MAX_WIDTH)
+	draw.text((30, 160), wrapped_description, font=main_font, fill=0)
+
+	safe_name = "".join(char for char in item_code if char.isalnum()) or "barcode"
+	return f"{safe_name}.png", _encode_png_grayscale(label)
+
+
+def generate_barcode_image(
+	item_code: str,
+	description: str,
+	output_dir: Optional[Path] = None,
+) -> Path:
+	"""Write a generated QR label to disk and return its path.
+
+	Thin file-based wrapper around :func:`generate_barcode_png` for callers
+	that need the label as a file rather than bytes.
+
 	Args:
 		item_code: SKU for which to create the barcode.
 		description: Human-readable description printed beneath the code.
@@ -154,47 +381,29 @@ def generate_barcode_image(
 	target_dir = Path(output_dir or tempfile.gettempdir())
 	target_dir.mkdir(parents=True, exist_ok=True)
 
-	main_font_path = _resolve_font_file("arial.ttf")
-	bold_font_path = _resolve_font_file("arialbd.ttf")
+	name, data = generate_barcode_png(item_code, description)
+	image_path = target_dir / name
+	image_path.write_bytes(data)
+	return image_path
 
-	# Create QR code matching the historical configuration.
-	qr = qrcode.QRCode(
-		version=1,
-		error_correction=qrcode.constants.ERROR_CORRECT_L,
-		box_size=10,
-		border=4,
-	)
-	qr.add_data(item_code)
-	qr.make(fit=True)
-	qr_image = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-
-	# Canvas dimensions at 300 DPI for 70mm x 30mm labels.
-	dpi = 300
-	canvas_width = int(70 * 0.0393701 * dpi)
-	canvas_height = int(30 * 0.0393701 * dpi)
-	label = Image.new("RGB", (canvas_width, canvas_height), "white")
-
-	# Resize QR image to match legacy layout.
-	qr_target_width = 150
-	aspect_ratio = qr_image.height / qr_image.width
-	qr_target_height = int(qr_target_width * aspect_ratio)
-	qr_image = qr_image.resize((qr_target_width, qr_target_height))
-	QR_IMAGE_PADDING_X = 40
-	QR_IMAGE_PADDING_Y = 40
-	label.paste(qr_image, (canvas_width - qr_target_width - QR_IMAGE_PADDING_X, QR_IMAGE_PADDING_Y))
 
-	draw = ImageDraw.Draw(label)
-	main_font = ImageFont.truetype(str(main_font_path), 45)
-	bold_font = ImageFont.truetype(str(bold_font_path), 100)
+def _generate_barcode_entries(variants: List[Variant]) -> List[tuple[str, bytes]]:
+	"""Render barcode labels for each variant, fanning out across threads.
 
-	draw.text((30, 30), item_code, font=bold_font, fill=(0, 0, 0))
-	wrapped_description = _wrap_text(description.split(), main_font, (label.width // 2) + 200)
-	draw.text((30, 160), wrapped_description, font=main_font, fill=(0, 0, 0))
+	QR generation, font rasterization, and PNG encoding all release the GIL
+	inside Pillow's C code, so threads give a real speedup on multi-variant
+	purchase orders. Single-variant orders skip the executor overhead.
+	"""
 
-	safe_name = "".join(char for char in item_code if char.isalnum()) or "barcode"
-	image_path = target_dir / f"{safe_name}.png"
-	label.save(image_path)
-	return image_path
+	def _generate(variant: Variant) -> tuple[str, bytes]:
+		return generate_barcode_png(variant.item_code, variant.description)
+
+	if len(variants) < 2:
+		return [_generate(variant) for variant in variants]
+
+	max_workers = min(len(variants), 8, os.cpu_count() or 2)
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		return list(executor.map(_generate, variants))
 
 
 def bundle_barcodes(
@@ -202,41 +411,62 @@ def bundle_barcodes(
 	barcode_paths: Iterable[Path],
 	output_dir: Optional[Path] = None,
 ) -> Path:
-	"""Bundle generated barcode files into a per-PO zip archive."""
+	"""Bundle generated barcode files into a per-PO zip archive.
+
+	The archive is deliberately uncompressed (``ZIP_STORED``): PNG payloads
+	are already DEFLATE-compressed internally, so re-compressing them only
+	burns CPU for no size benefit.
+	"""
 
 	target_dir = Path(output_dir or tempfile.gettempdir())
 	target_dir.mkdir(parents=True, exist_ok=True)
 	zip_path = target_dir / f"{po_number}.zip"
 
-	with zipfile.ZipFile(zip_path, "w") as archive:
+	with zipfile.ZipFile(
+		zip_path, "w", compression=zipfile.ZIP_STORED, allowZip64=False
+	) as archive:
 		for path in barcode_paths:
 			archive.write(path, arcname=Path(path).name)
 
 	return zip_path
 
 
+def bundle_barcodes_in_memory(barcode_entries: Iterable[tuple[str, bytes]]) -> bytes:
+	"""Bundle generated ``(name, png_bytes)`` entries into an in-memory zip.
+
+	Used on the email path so neither the labels nor the archive make a
+	round trip through the Function host's (slow) temp storage. Compression
+	stays ``ZIP_STORED`` for the same reason as :func:`bundle_barcodes`.
+	"""
+
+	buffer = io.BytesIO()
+	with zipfile.ZipFile(
+		buffer, "w", compression=zipfile.ZIP_STORED, allowZip64=False
+	) as archive:
+		for name, data in barcode_entries:
+			archive.writestr(name, data)
+
+	return buffer.getvalue()
+
+
 def build_email_subject(po_number: str) -> str:
 	"""Return the subject line used when emailing barcodes to Kaps."""
 
 	return f"Barcodes for PO {po_number}"
 
 
-def send_email_with_attachment(
-	*,
-	sender_email: str,
-	receiver_email: str,
-	subject: str,
-	body: str,
-	attachment_path: Optional[Path],
+@contextmanager
+def smtp_session(
 	smtp_host: Optional[str] = None,
 	smtp_port: Optional[int] = None,
-) -> None:
-	"""Send an email, optionally attaching the provided file.
-
-	If ``SMTP_USERNAME`` and ``SMTP_PASSWORD`` environment variables are present the
-	connection upgrades to TLS and authenticates with those credentials before
-	sending the message. This enables compatibility with providers such as Gmail
-	that require STARTTLS + login on port 587.
+) -> Iterator[smtplib.SMTP]:
+	"""Yield an SMTP session that is negotiated once and reusable for sends.
+
+	Connects, upgrades to TLS where the server supports it, and authenticates
+	with the ``SMTP_USERNAME``/``SMTP_PASSWORD`` credentials when both are
+	present. Callers that send several messages in one invocation should open
+	a single session and pass it to :func:`send_email_with_attachment` so the
+	TCP + TLS + AUTH round-trips are paid once.
 	"""
 
 	smtp_host = smtp_host or os.getenv("SMTP_HOST", "smtp.test.com")
@@ -254,36 +484,119 @@ def send_email_with_attachment(
 	if smtp_password and not smtp_username:
 		raise RuntimeError("SMTP_USERNAME must be set when SMTP_PASSWORD is provided.")
 
-	message = MIMEMultipart()
-	message["From"] = sender_email
-	message["To"] = receiver_email
-	message["Subject"] = subject
-	message.attach(MIMEText(body, "plain"))
-
-	if attachment_path is not None:
-		with open(attachment_path, "rb") as attachment:
-			part = MIMEBase("application", "octet-stream")
-			part.set_payload(attachment.read())
-		encoders.encode_base64(part)
-		part.add_header(
-			"Content-Disposition",
-			f"attachment; filename={Path(attachment_path).name}",
-		)
-		message.attach(part)
-
-	context = ssl.create_default_context()
 	LOGGER.info("Connecting to SMTP host %s:%s", smtp_host, smtp_port)
 	with smtplib.SMTP(smtp_host, smtp_port) as server:
 		server.ehlo()
 		try:
-			server.starttls(context=context)
+			server.starttls(context=_SSL_CONTEXT)
 		except smtplib.SMTPNotSupportedError:
 			LOGGER.warning("SMTP server %s:%s does not support STARTTLS", smtp_host, smtp_port)
 		else:
 			server.ehlo()
 		if smtp_username and smtp_password:
 			server.login(smtp_username, smtp_password)
-		server.sendmail(sender_email, [receiver_email], message.as_string())
+		yield server
+
+
+def send_email_with_attachments(
+	*,
+	sender_email: str,
+	receiver_email: str | List[str],
+	subject: str,
+	body: str,
+	attachments: Iterable[tuple[str, bytes]],
+	smtp_host: Optional[str] = None,
+	smtp_port: Optional[int] = None,
+	smtp_connection: Optional[smtplib.SMTP] = None,
+) -> None:
+	"""Send one email carrying any number of ``(filename, data)`` attachments.
+
+	Batching every file into a single MIME message keeps the cost of a
+	multi-PO invocation at one SMTP transaction instead of one per file.
+	``receiver_email`` may be a list of addresses; all of them go into a
+	single ``To`` header, so the message body crosses the wire once with
+	one ``RCPT TO`` per recipient rather than one full send each.
+
+	The connection behaviour (TLS upgrade, ``SMTP_USERNAME``/``SMTP_PASSWORD``
+	authentication) is documented on :func:`smtp_session`. ``smtp_connection``
+	may be a session obtained from it; passing one avoids repeating the
+	TCP + TLS + AUTH round-trips when several messages go out in one
+	invocation.
+	"""
+
+	if isinstance(receiver_email, str):
+		recipients = [receiver_email]
+	else:
+		recipients = list(receiver_email)
+
+	message = EmailMessage()
+	message["From"] = sender_email
+	message["To"] = ", ".join(recipients)
+	message["Subject"] = subject
+	message.set_content(body)
+
+	for filename, data in attachments:
+		message.add_attachment(
+			data,
+			maintype="application",
+			subtype="octet-stream",
+			filename=filename,
+		)
+
+	if smtp_connection is not None:
+		try:
+			smtp_connection.noop()
+		except smtplib.SMTPServerDisconnected:
+			LOGGER.warning("Reusable SMTP connection was closed; opening a new one.")
+			smtp_connection = None
+	if smtp_connection is not None:
+		smtp_connection.send_message(message)
+		return
+
+	with smtp_session(smtp_host, smtp_port) as server:
+		# send_message streams the MIME tree to the socket rather than
+		# materializing the whole base64-encoded payload as one string.
+		server.send_message(message)
+
+
+def send_email_with_attachment(
+	*,
+	sender_email: str,
+	receiver_email: str | List[str],
+	subject: str,
+	body: str,
+	attachment_path: Optional[Path],
+	attachment_data: Optional[bytes] = None,
+	attachment_filename: Optional[str] = None,
+	smtp_host: Optional[str] = None,
+	smtp_port: Optional[int] = None,
+	smtp_connection: Optional[smtplib.SMTP] = None,
+) -> None:
+	"""Send an email with at most one attachment.
+
+	Thin wrapper around :func:`send_email_with_attachments`. The attachment
+	may be given either as ``attachment_path`` (read from disk) or as
+	in-memory ``attachment_data`` with an ``attachment_filename``.
+	"""
+
+	if attachment_path is not None:
+		attachment_data = Path(attachment_path).read_bytes()
+		attachment_filename = Path(attachment_path).name
+
+	attachments: List[tuple[str, bytes]] = []
+	if attachment_data is not None:
+		attachments.append((attachment_filename or "attachment", attachment_data))
+
+	send_email_with_attachments(
+		sender_email=sender_email,
+		receiver_email=receiver_email,
+		subject=subject,
+		body=body,
+		attachments=attachments,
+		smtp_host=smtp_host,
+		smtp_port=smtp_port,
+		smtp_connection=smtp_connection,
+	)
 
 
 def _extract_sender(headers: Mapping[str, str]) -> Optional[str]:
@@ -315,9 +628,11 @@ def _extract_sender(headers: Mapping[str, str]) -> Optional[str]:
 		raw_value = normalized_headers.get(header_name)
 		if not raw_value:
 			continue
-		for candidate in (value.strip() for value in raw_value.split(",")):
-			if "@" in candidate:
-				return candidate
+		# One C-level scan for the first email-looking token, instead of
+		# splitting and stripping every comma-separated value.
+		match = _EMAIL_RE.search(raw_value)
+		if match:
+			return match.group(0)
 
 	return None
 
@@ -327,7 +642,9 @@ def verify_sender(actual_sender: Optional[str], expected_sender: Optional[str])
 
 	if not expected_sender:
 		raise PermissionError("Expected WMS sender email is not configured.")
-	if actual_sender != expected_sender:
+	# Constant-time comparison so rejection latency reveals nothing about
+	# how much of the configured address a probe matched.
+	if not hmac.compare_digest(actual_sender or "", expected_sender):
 		raise PermissionError("Unauthorized sender.")
 
 
@@ -349,6 +666,18 @@ def handle_malformed_email(
 
 
 
+@functools.lru_cache(maxsize=4)
+def _blob_service_from_connection_string(connection_string: str) -> BlobServiceClient:
+	"""Build one client per connection string and reuse it across invocations.
+
+	The client owns an HTTP connection pool, so constructing it per request
+	would re-parse the connection string and throw away pooled TLS sessions
+	on warm workers.
+	"""
+
+	return BlobServiceClient.from_connection_string(connection_string)
+
+
 def _ensure_blob_service(blob_service: Optional[BlobServiceClient]) -> BlobServiceClient:
 	if blob_service is not None:
 		return blob_service
@@ -356,7 +685,12 @@ def _ensure_blob_service(blob_service: Optional[BlobServiceClient]) -> BlobServi
 	connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 	if not connection_string:
 		raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not configured.")
-	return BlobServiceClient.from_connection_string(connection_string)
+	return _blob_service_from_connection_string(connection_string)
+
+
+# Maps (container, blob) to the last seen ETag and parsed set so warm Function
+# instances can skip re-downloading an unchanged processed_pos.log.
+_PROCESSED_ORDERS_CACHE: dict[tuple[str, str], tuple[str, Set[str]]] = {}
 
 
 def fetch_processed_purchase_orders(
@@ -365,17 +699,88 @@ def fetch_processed_purchase_orders(
 	container_name: str = "completed-purchase-orders",
 	blob_name: str = "processed_pos.log",
 ) -> Set[str]:
-	"""Return the set of purchase orders that have already been processed."""
+	"""Return the set of purchase orders that have already been processed.
+
+	The download is conditional on the last seen ETag: when the blob has not
+	changed since a previous invocation on this worker, the cached set is
+	returned without transferring the log again.
+	"""
 
 	blob_service = _ensure_blob_service(blob_service)
 	blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
 
+	cache_key = (container_name, blob_name)
+	cached = _PROCESSED_ORDERS_CACHE.get(cache_key)
+	conditions = {}
+	if cached is not None:
+		conditions = {"etag": cached[0], "match_condition": MatchConditions.IfModified}
+
+	# Consume the download chunk by chunk, splitting out complete lines as
+	# they arrive, so the log is never materialised as one bytes object plus
+	# a str copy plus a line list.
+	processed: Set[str] = set()
 	try:
-		contents = blob_client.download_blob().readall().decode("utf-8")
+		downloader = blob_client.download_blob(**conditions)
+		remainder = b""
+		for chunk in downloader.chunks():
+			remainder += chunk
+			*lines, remainder = remainder.split(b"\n")
+			processed.update(line.decode("utf-8").strip() for line in lines if line.strip())
+		if remainder.strip():
+			processed.add(remainder.decode("utf-8").strip())
+	except ResourceNotModifiedError:
+		return set(cached[1])
 	except Exception:
 		return set()
 
-	return {line.strip() for line in contents.splitlines() if line.strip()}
+	etag = downloader.properties.etag
+	if isinstance(etag, str):
+		_PROCESSED_ORDERS_CACHE[cache_key] = (etag, set(processed))
+	return processed
+
+
+def append_processed_purchase_order(
+	po_number: str,
+	*,
+	blob_service: Optional[BlobServiceClient] = None,
+	container_name: str = "completed-purchase-orders",
+	blob_name: str = "processed_pos.log",
+) -> None:
+	"""Append a single purchase order to the processed log.
+
+	Uses an append blob so completing a PO uploads one line instead of
+	rewriting the entire log, and stays safe under concurrent invocations.
+	"""
+
+	blob_service = _ensure_blob_service(blob_service)
+	blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
+
+	data = f"{po_number}\n".encode("utf-8")
+	try:
+		blob_client.append_block(data)
+	except ResourceNotFoundError:
+		blob_client.create_append_blob()
+		blob_client.append_block(data)
+	except HttpResponseError as error:
+		if error.error_code != "InvalidBlobType":
+			raise
+		# The log predates append blobs as a block blob (first deploy, or an
+		# old consolidation rewrite); migrate it in place and retry.
+		_migrate_log_to_append_blob(blob_client)
+		blob_client.append_block(data)
+	_PROCESSED_ORDERS_CACHE.pop((container_name, blob_name), None)
+
+
+def _migrate_log_to_append_blob(blob_client) -> None:
+	"""Recreate a legacy block-blob processed log as an append blob in place."""
+
+	existing = blob_client.download_blob().readall()
+	if existing and not existing.endswith(b"\n"):
+		existing += b"\n"
+	blob_client.delete_blob()
+	blob_client.create_append_blob()
+	if existing:
+		blob_client.append_block(existing)
 
 
 def persist_processed_purchase_orders(
@@ -385,13 +790,24 @@ def persist_processed_purchase_orders(
 	container_name: str = "completed-purchase-orders",
 	blob_name: str = "processed_pos.log",
 ) -> None:
-	"""Write the canonical list of processed purchase orders to Blob Storage."""
+	"""Write the canonical list of processed purchase orders to Blob Storage.
+
+	This rewrites the whole log; routine per-PO completion should go through
+	:func:`append_processed_purchase_order` instead. It remains for seeding
+	the log with historic orders and for periodic consolidation, and writes
+	an append blob so subsequent per-PO appends keep working against the
+	rewritten log.
+	"""
 
 	blob_service = _ensure_blob_service(blob_service)
 	blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
 
-	data = "\n".join(sorted(processed_orders)) + "\n"
-	blob_client.upload_blob(data.encode("utf-8"), overwrite=True)
+	# PO numbers are ASCII, so encoding per entry and joining as bytes keeps
+	# serialization to a single C-level pass instead of sort+join+encode.
+	data = b"\n".join(sorted(po.encode("utf-8") for po in processed_orders)) + b"\n"
+	# Append blocks must commit in order, so there is no parallel-upload knob
+	# here; the SDK chunks oversized payloads into sequential appends.
+	blob_client.upload_blob(data, overwrite=True, blob_type=BlobType.AppendBlob)
 
 
 def build_email_body(po_number: str) -> str:
@@ -431,20 +847,6 @@ def notify_admin_email(*, admin_email: str, sender_email: str, subject: str, bod
 	)
 
 
-def _cleanup_temp_directory(path: Path) -> None:
-	"""Best-effort removal of temporary assets."""
-
-	for child in path.glob("*"):
-		try:
-			child.unlink()
-		except OSError:
-			LOGGER.debug("Unable to delete temporary file %s", child, exc_info=True)
-	try:
-		path.rmdir()
-	except OSError:
-		LOGGER.debug("Unable to delete temporary directory %s", path, exc_info=True)
-
-
 def _load_required_env() -> dict[str, str]:
 	"""Retrieve required environment variables, raising if any are missing."""
 
@@ -495,34 +897,21 @@ def process_email(
 		LOGGER.info("Purchase order %s already processed; skipping.", po_number)
 		return f"PO {po_number} was already processed."
 
-	temp_dir = Path(tempfile.mkdtemp(prefix="barcode_generator_"))
-	try:
-		barcode_paths = [
-			generate_barcode_image(
-				variant.item_code,
-				variant.description,
-				output_dir=temp_dir,
-			)
-			for variant in variants
-		]
-		zip_path = bundle_barcodes(po_number, barcode_paths, output_dir=temp_dir)
-		subject = build_email_subject(po_number)
-		body = build_email_body(po_number)
-		receiver_email = _resolve_recipient(env)
-		send_email_with_attachment(
-			sender_email=env["SENDER_EMAIL"],
-			receiver_email=receiver_email,
-			subject=subject,
-			body=body,
-			attachment_path=zip_path,
-		)
-		processed_orders.add(po_number)
-		persist_processed_purchase_orders(
-			processed_orders=processed_orders,
-			blob_service=blob_service,
-		)
-	finally:
-		_cleanup_temp_directory(temp_dir)
+	barcode_entries = _generate_barcode_entries(variants)
+	zip_data = bundle_barcodes_in_memory(barcode_entries)
+	subject = build_email_subject(po_number)
+	body = build_email_body(po_number)
+	receiver_email = _resolve_recipient(env)
+	send_email_with_attachment(
+		sender_email=env["SENDER_EMAIL"],
+		receiver_email=receiver_email,
+		subject=subject,
+		body=body,
+		attachment_path=None,
+		attachment_data=zip_data,
+		attachment_filename=f"{po_number}.zip",
+	)
+	append_processed_purchase_order(po_number, blob_service=blob_service)
 
 	return f"Successfully processed PO {po_number}."
 
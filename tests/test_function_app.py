@@ -1,22 +1,29 @@
 from pathlib import Path
+import io
 import zipfile
 from unittest.mock import MagicMock, patch
 
 import pytest
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.storage.blob import BlobType
 from PIL import Image
 
 from src.function_app import (
     Variant,
     _extract_sender,
+    append_processed_purchase_order,
     bundle_barcodes,
+    bundle_barcodes_in_memory,
     build_email_subject,
     generate_barcode_image,
+    generate_barcode_png,
     handle_malformed_email,
     fetch_processed_purchase_orders,
     persist_processed_purchase_orders,
     process_email,
     parse_html_email,
     send_email_with_attachment,
+    send_email_with_attachments,
     verify_sender,
 )
 
@@ -47,7 +54,7 @@ def _make_blob_service(existing: str = ""):
     blob_service.get_blob_client.return_value = blob_client
 
     download_blob = MagicMock()
-    download_blob.readall.return_value = existing.encode()
+    download_blob.chunks.return_value = [existing.encode()]
     blob_client.download_blob.return_value = download_blob
 
     return blob_service, blob_client
@@ -70,6 +77,26 @@ def test_parse_html_email_returns_variants():
     ]
 
 
+def test_parse_html_email_keeps_rows_with_nested_markup():
+    html = """
+    <table>
+      <tr>
+        <td>PO: UPD-PO27652 | Item: V109327 | Desc: Plain cell</td>
+      </tr>
+      <tr>
+        <td><b>PO:</b> UPD-PO27652 | Item: V109328 | Desc: Nested cell</td>
+      </tr>
+    </table>
+    """
+
+    variants = parse_html_email(html)
+
+    assert variants == [
+        Variant(po_number="UPD-PO27652", item_code="V109327", description="Plain cell"),
+        Variant(po_number="UPD-PO27652", item_code="V109328", description="Nested cell"),
+    ]
+
+
 def test_po_number_used_for_zipfile_and_subject(tmp_path: Path):
     variants = parse_html_email(SAMPLE_HTML)
     po_number = variants[0].po_number
@@ -102,6 +129,34 @@ def test_bundle_barcodes_contains_all_files(tmp_path: Path):
         assert set(archive.namelist()) == {path.name for path in barcodes}
 
 
+def test_bundle_barcodes_in_memory_contains_all_entries():
+    entries = [("barcode_A.png", b"A"), ("barcode_B.png", b"B")]
+
+    data = bundle_barcodes_in_memory(entries)
+
+    with zipfile.ZipFile(io.BytesIO(data), "r") as archive:
+        assert set(archive.namelist()) == {name for name, _ in entries}
+        assert archive.read("barcode_A.png") == b"A"
+
+
+def test_generate_barcode_png_returns_named_png():
+    name, data = generate_barcode_png("V109327", "Sample description")
+
+    assert name == "V109327.png"
+    assert data.startswith(b"\x89PNG")
+
+
+def test_generate_barcode_png_memoises_repeated_variants():
+    generate_barcode_png.cache_clear()
+
+    first = generate_barcode_png("V200001", "Repeated variant")
+    hits_before = generate_barcode_png.cache_info().hits
+    second = generate_barcode_png("V200001", "Repeated variant")
+
+    assert second == first
+    assert generate_barcode_png.cache_info().hits == hits_before + 1
+
+
 def test_generate_barcode_image_creates_file(tmp_path: Path):
     barcode_path = generate_barcode_image(
         "V109327",
@@ -114,6 +169,7 @@ def test_generate_barcode_image_creates_file(tmp_path: Path):
 
     with Image.open(barcode_path) as image:
         assert image.size == (826, 354)
+        assert image.mode == "L"
 
 
 def test_send_email_with_attachment_uses_zip(tmp_path: Path):
@@ -135,12 +191,64 @@ def test_send_email_with_attachment_uses_zip(tmp_path: Path):
         server = smtp_mock.return_value.__enter__.return_value
         server.starttls.assert_called_once()
         server.login.assert_not_called()
-        args, kwargs = server.sendmail.call_args
-        assert args[0] == "sender@example.com"
-        assert args[1] == ["kaps@example.com"]
-        assert "Barcodes for PO 123" in args[2]
-        assert "test.zip" in args[2]
-        assert kwargs == {}
+        server.send_message.assert_called_once()
+        message = server.send_message.call_args.args[0]
+        assert message["From"] == "sender@example.com"
+        assert message["To"] == "kaps@example.com"
+        assert message["Subject"] == "Barcodes for PO 123"
+        attachments = list(message.iter_attachments())
+        assert [part.get_filename() for part in attachments] == ["test.zip"]
+        assert attachments[0].get_content() == b"zip-bytes"
+
+
+@pytest.mark.parametrize("attachment_count", [1, 5])
+def test_send_email_with_attachments_sends_one_message(attachment_count: int):
+    attachments = [
+        (f"UPD-PO{index}.zip", f"zip-{index}".encode())
+        for index in range(attachment_count)
+    ]
+
+    with patch("src.function_app.smtplib.SMTP") as smtp_mock:
+        send_email_with_attachments(
+            sender_email="sender@example.com",
+            receiver_email="kaps@example.com",
+            subject="Barcodes",
+            body="Body",
+            attachments=attachments,
+            smtp_host="smtp.test.com",
+            smtp_port=587,
+        )
+
+        smtp_mock.assert_called_once_with("smtp.test.com", 587)
+        server = smtp_mock.return_value.__enter__.return_value
+        server.send_message.assert_called_once()
+        message = server.send_message.call_args.args[0]
+        filenames = [part.get_filename() for part in message.iter_attachments()]
+        assert filenames == [name for name, _ in attachments]
+
+
+def test_send_email_with_attachments_accepts_recipient_list():
+    with patch("src.function_app.smtplib.SMTP") as smtp_mock:
+        send_email_with_attachments(
+            sender_email="sender@example.com",
+            receiver_email=[
+                "kaps@example.com",
+                "purchasing@example.com",
+                "goods-in@example.com",
+            ],
+            subject="Barcodes",
+            body="Body",
+            attachments=[("UPD-PO1.zip", b"zip")],
+            smtp_host="smtp.test.com",
+            smtp_port=587,
+        )
+
+        server = smtp_mock.return_value.__enter__.return_value
+        server.send_message.assert_called_once()
+        message = server.send_message.call_args.args[0]
+        assert message["To"] == (
+            "kaps@example.com, purchasing@example.com, goods-in@example.com"
+        )
 
 
 def test_send_email_with_attachment_logins_when_credentials_present(monkeypatch, tmp_path: Path):
@@ -225,7 +333,7 @@ def test_fetch_processed_purchase_orders_returns_set():
     blob_client = blob_service.get_blob_client.return_value
 
     download_blob = MagicMock()
-    download_blob.readall.return_value = b"UPD-PO123\nUPD-PO456\n"
+    download_blob.chunks.return_value = [b"UPD-PO123\nUPD-", b"PO456\n"]
     blob_client.download_blob.return_value = download_blob
 
     processed = fetch_processed_purchase_orders(
@@ -241,6 +349,44 @@ def test_fetch_processed_purchase_orders_returns_set():
     assert processed == {"UPD-PO123", "UPD-PO456"}
 
 
+def test_append_processed_purchase_order_appends_single_line():
+    blob_service = MagicMock()
+    blob_client = blob_service.get_blob_client.return_value
+
+    append_processed_purchase_order("UPD-PO999", blob_service=blob_service)
+
+    blob_client.append_block.assert_called_once_with(b"UPD-PO999\n")
+    blob_client.create_append_blob.assert_not_called()
+
+
+def test_append_processed_purchase_order_creates_blob_when_missing():
+    blob_service = MagicMock()
+    blob_client = blob_service.get_blob_client.return_value
+    blob_client.append_block.side_effect = [ResourceNotFoundError("missing"), None]
+
+    append_processed_purchase_order("UPD-PO999", blob_service=blob_service)
+
+    blob_client.create_append_blob.assert_called_once()
+    assert blob_client.append_block.call_count == 2
+
+
+def test_append_processed_purchase_order_migrates_block_blob_log():
+    blob_service = MagicMock()
+    blob_client = blob_service.get_blob_client.return_value
+    wrong_type = HttpResponseError("The blob type is invalid for this operation.")
+    wrong_type.error_code = "InvalidBlobType"
+    blob_client.append_block.side_effect = [wrong_type, None, None]
+    download = blob_client.download_blob.return_value
+    download.readall.return_value = b"UPD-PO111\nUPD-PO222"
+
+    append_processed_purchase_order("UPD-PO999", blob_service=blob_service)
+
+    blob_client.delete_blob.assert_called_once()
+    blob_client.create_append_blob.assert_called_once()
+    appended = [call.args[0] for call in blob_client.append_block.call_args_list]
+    assert appended == [b"UPD-PO999\n", b"UPD-PO111\nUPD-PO222\n", b"UPD-PO999\n"]
+
+
 def test_persist_processed_purchase_orders_writes_sorted_lines():
     blob_service = MagicMock()
     blob_client = blob_service.get_blob_client.return_value
@@ -258,7 +404,7 @@ def test_persist_processed_purchase_orders_writes_sorted_lines():
     )
     upload_args, upload_kwargs = blob_client.upload_blob.call_args
     assert upload_args[0] == b"UPD-PO111\nUPD-PO222\n"
-    assert upload_kwargs == {"overwrite": True}
+    assert upload_kwargs == {"overwrite": True, "blob_type": BlobType.AppendBlob}
 
 
 def test_persist_processed_purchase_orders_appends_to_existing(tmp_path: Path):
@@ -266,7 +412,7 @@ def test_persist_processed_purchase_orders_appends_to_existing(tmp_path: Path):
     blob_client = blob_service.get_blob_client.return_value
 
     download_blob = MagicMock()
-    download_blob.readall.return_value = b"existing\n"
+    download_blob.chunks.return_value = [b"existing\n"]
     blob_client.download_blob.return_value = download_blob
 
     existing = fetch_processed_purchase_orders(
@@ -292,23 +438,12 @@ def test_process_email_routes_messages_to_admin(monkeypatch, tmp_path: Path):
     monkeypatch.setenv("ADMIN_EMAIL", "admin@example.com")
     monkeypatch.delenv("EMAIL_VERIFICATION_MODE", raising=False)
 
-    working_dir = tmp_path / "work"
-    working_dir.mkdir()
-    monkeypatch.setattr("src.function_app.tempfile.mkdtemp", lambda prefix=None: str(working_dir))
-
-    def fake_generate(item_code: str, description: str, output_dir: Path) -> Path:
-        path = Path(output_dir) / f"{item_code}.png"
-        path.write_bytes(b"barcode")
-        return path
-
-    def fake_bundle(po_number: str, barcode_paths, output_dir: Path | None = None) -> Path:
-        path = Path(output_dir or working_dir) / f"{po_number}.zip"
-        path.write_bytes(b"zip")
-        return path
+    def fake_generate(item_code: str, description: str) -> tuple[str, bytes]:
+        return f"{item_code}.png", b"barcode"
 
     with (
-        patch("src.function_app.generate_barcode_image", side_effect=fake_generate),
-        patch("src.function_app.bundle_barcodes", side_effect=fake_bundle),
+        patch("src.function_app.generate_barcode_png", side_effect=fake_generate),
+        patch("src.function_app.bundle_barcodes_in_memory", return_value=b"zip"),
         patch("src.function_app.send_email_with_attachment") as send_email_mock,
     ):
         blob_service, blob_client = _make_blob_service()
@@ -324,7 +459,9 @@ def test_process_email_routes_messages_to_admin(monkeypatch, tmp_path: Path):
     kwargs = send_email_mock.call_args.kwargs
     assert kwargs["receiver_email"] == "admin@example.com"
     assert kwargs["sender_email"] == "noreply@example.com"
-    blob_client.upload_blob.assert_called_once()
+    assert kwargs["attachment_data"] == b"zip"
+    assert kwargs["attachment_filename"] == "UPD-PO27652.zip"
+    blob_client.append_block.assert_called_once_with(b"UPD-PO27652\n")
 
 
 def test_process_email_can_target_kaps_when_verification_disabled(monkeypatch, tmp_path: Path):
@@ -334,23 +471,12 @@ def test_process_email_can_target_kaps_when_verification_disabled(monkeypatch, t
     monkeypatch.setenv("ADMIN_EMAIL", "admin@example.com")
     monkeypatch.setenv("EMAIL_VERIFICATION_MODE", "false")
 
-    working_dir = tmp_path / "prod"
-    working_dir.mkdir()
-    monkeypatch.setattr("src.function_app.tempfile.mkdtemp", lambda prefix=None: str(working_dir))
-
-    def fake_generate(item_code: str, description: str, output_dir: Path) -> Path:
-        path = Path(output_dir) / f"{item_code}.png"
-        path.write_bytes(b"barcode")
-        return path
-
-    def fake_bundle(po_number: str, barcode_paths, output_dir: Path | None = None) -> Path:
-        path = Path(output_dir or working_dir) / f"{po_number}.zip"
-        path.write_bytes(b"zip")
-        return path
+    def fake_generate(item_code: str, description: str) -> tuple[str, bytes]:
+        return f"{item_code}.png", b"barcode"
 
     with (
-        patch("src.function_app.generate_barcode_image", side_effect=fake_generate),
-        patch("src.function_app.bundle_barcodes", side_effect=fake_bundle),
+        patch("src.function_app.generate_barcode_png", side_effect=fake_generate),
+        patch("src.function_app.bundle_barcodes_in_memory", return_value=b"zip"),
         patch("src.function_app.send_email_with_attachment") as send_email_mock,
     ):
         blob_service, blob_client = _make_blob_service()
@@ -364,7 +490,7 @@ def test_process_email_can_target_kaps_when_verification_disabled(monkeypatch, t
     send_email_mock.assert_called_once()
     kwargs = send_email_mock.call_args.kwargs
     assert kwargs["receiver_email"] == "kaps@example.com"
-    blob_client.upload_blob.assert_called_once()
+    blob_client.append_block.assert_called_once_with(b"UPD-PO27652\n")
 
 
 def test_process_email_skips_previously_processed_order(monkeypatch, tmp_path: Path):
@@ -373,10 +499,6 @@ def test_process_email_skips_previously_processed_order(monkeypatch, tmp_path: P
     monkeypatch.setenv("KAPS_EMAIL", "kaps@example.com")
     monkeypatch.setenv("ADMIN_EMAIL", "admin@example.com")
 
-    working_dir = tmp_path / "dup"
-    working_dir.mkdir()
-    monkeypatch.setattr("src.function_app.tempfile.mkdtemp", lambda prefix=None: str(working_dir))
-
     blob_service, blob_client = _make_blob_service(existing="UPD-PO27652\n")
 
     message = process_email(
@@ -388,3 +510,4 @@ def test_process_email_skips_previously_processed_order(monkeypatch, tmp_path: P
 
     assert message == "PO UPD-PO27652 was already processed."
     blob_client.upload_blob.assert_not_called()
+    blob_client.append_block.assert_not_called()